@@ -2,12 +2,48 @@ import time
 import serial
 import serial.tools.list_ports
 from threading import Thread
+from collections import deque
 
+import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+from matplotlib.transforms import Affine2D
+
+def _normalize_row(row:str, delim:str):
+    """ drop empty fields made by leading, trailing or repeated delimiters """
+    row = row.strip(delim)
+    double = delim * 2
+    while double in row:
+        row = row.replace(double, delim)
+    return row
+
+def _parse_row(row:str, delim:str):
+    """ parse a normalized row into a float array in C, or return `None` if any field is not a number """
+    try:
+        vals = np.fromstring(row, sep=delim, dtype=np.float64)
+    except ValueError:
+        return None
+    if vals.size != row.count(delim) + 1:
+        return None
+    return vals
+
+def _deadband_ylim(ylim, data:np.ndarray):
+    """ return new y-limits when finite `data` leaves `ylim` or shrinks to under half of it, or `None` to keep `ylim` """
+    # `nan` or `inf` samples, e.g. printed by Arduino, are left out so they never reach `set_ylim`
+    data = data[np.isfinite(data)]
+    if data.size == 0:
+        return None
+    ymin, ymax = data.min(), data.max()
+    if ymax <= ymin:
+        return None
+    if ylim is not None:
+        cur_min, cur_max = ylim
+        if ymin >= cur_min and ymax <= cur_max and (cur_max - cur_min) <= 2 * (ymax - ymin):
+            return None
+    ymargin = 0.125 * (ymax - ymin)
+    return (ymin - ymargin, ymax + ymargin)
 
 class BlitManager:
-    def __init__(self, canvas, animated_artists=()):
+    def __init__(self, canvas, animated_artists=(), bbox=None):
         """
         This entire class is from [the official matplotlib doc](https://matplotlib.org/stable/tutorials/advanced/blitting.html#class-based-example).
 
@@ -20,8 +56,13 @@ class BlitManager:
 
         animated_artists : Iterable[Artist]
             List of the artists to manage
+
+        bbox : BboxBase, optional
+            Region to save and blit, such as `Axes.bbox`. Defaults to the
+            whole figure. Every animated artist must be drawn inside it.
         """
         self.canvas = canvas
+        self._bbox = canvas.figure.bbox if bbox is None else bbox
         self._bg = None
         self._artists = []
 
@@ -36,7 +77,7 @@ class BlitManager:
         if event is not None:
             if event.canvas != cv:
                 raise RuntimeError
-        self._bg = cv.copy_from_bbox(cv.figure.bbox)
+        self._bg = cv.copy_from_bbox(self._bbox)
         self._draw_animated()
 
     def add_artist(self, art):
@@ -63,10 +104,18 @@ class BlitManager:
         for a in self._artists:
             fig.draw_artist(a)
 
-    def update(self):
-        """Update the screen with animated artists."""
+    def update(self, flush=True):
+        """
+        Update the screen with animated artists.
+
+        Parameters
+        ----------
+        flush : bool
+            Whether to let the GUI event loop process pending events. This
+            can be skipped when called from a callback of a running event
+            loop, such as an animation timer.
+        """
         cv = self.canvas
-        fig = cv.figure
         # paranoia in case we missed the draw event,
         if self._bg is None:
             self.on_draw(None)
@@ -76,22 +125,24 @@ class BlitManager:
             # draw all of the animated artists
             self._draw_animated()
             # update the GUI state
-            cv.blit(fig.bbox)
+            cv.blit(self._bbox)
         # let the GUI event loop process anything it has to do
-        cv.flush_events()
+        if flush:
+            cv.flush_events()
 
 class Poller:
-    def __init__(self, filter=None):
+    def __init__(self, filter=None, maxlen:int=4096):
         """ after initialization, you must `connect()` to your serial port and `start()` receiving data.
         
         Args:
-            filter (lambda) : a string filter before splitting with delimiter.
+            filter (lambda) : a string filter before splitting with delimiter, applied by the plotter so that the reader thread only drains the port.
+            maxlen (int) : max number of unread rows to keep, dropping the oldest ones when exceeded
         """
 
         self.thread = None
         self.serial = None
-        self.runing = False
-        self.rows = []
+        self.running = False
+        self.rows = deque(maxlen=maxlen)
         
         self.filter = filter
 
@@ -106,16 +157,35 @@ class Poller:
         self.running = False
         self.thread.join()
 
+    def apply_filter(self, row:str):
+        """ apply `self.filter` to a row if it is given """
+        if self.filter is not None and callable(self.filter):
+            return self.filter(row)
+        return row
+
+    def take_rows(self):
+        """ swap out and return the unread rows, so that the reader thread keeps appending to a fresh buffer """
+        rows, self.rows = self.rows, deque(maxlen=self.rows.maxlen)
+        return rows
+
     def _thr_read(self):
         # this prevents reading debug string when board is initialized
         time.sleep(0.3)
 
+        # read every byte available at once and split lines here, rather than a syscall per line
+        buf = bytearray()
         while self.running and self.serial.is_open:
-            data = self.serial.readline().decode().strip()
-            if len(data) > 0:
-                if self.filter is not None and callable(self.filter) :
-                    data = self.filter(data)
-                self.rows.append(data)
+            n = self.serial.in_waiting
+            buf += self.serial.read(n if n else 1)
+            if b'\n' not in buf:
+                continue
+
+            *lines, rest = buf.split(b'\n')
+            buf = bytearray(rest)
+            for line in lines:
+                data = line.decode('ascii', 'replace').strip()
+                if len(data) > 0:
+                    self.rows.append(data)
             
 
     def connect(self, keyword:str, baud:int):
@@ -146,10 +216,14 @@ class Poller:
             else:
                 ser.port = port_to_connect
                 ser.baudrate = baud
-                ser.timeout = None
+                # short timeout so the reader thread can notice `close()` while the port is idle
+                ser.timeout = 0.1
                 ser.open()
 
                 if ser.is_open:
+                    # a larger driver buffer keeps bursts from overflowing between reads (only available on Windows)
+                    if hasattr(ser, 'set_buffer_size'):
+                        ser.set_buffer_size(rx_size=65536, tx_size=4096)
                     print('connected.')
                 else:
                     print('connection failed.')
@@ -176,35 +250,55 @@ class LinePlotter:
         self.fig.canvas.mpl_connect('button_press_event', self._click_to_pause)
         self.fig.canvas.mpl_connect('close_event', self._finish_when_closed)
         self.paused = False
+        self.timer = None
 
         # data trim
         self.delim = delim
         self.row_idx = 0
         self.row_max = rows
+
+        # axis limits are only changed past a deadband, since each change forces a full redraw
+        self._ylim = None
+        self._xlim = None
+        self.x_block = max(1, self.row_max // 2)
         
         # init data to visualize
         self.labels = labels
         self.lines = {}
-        self.d = {'x':[0]*self.row_max}
-        for label in self.labels:
-            self.d[label] = [0]*self.row_max
-            (line,) = self.ax.plot(self.d['x'], self.d[label], animated=True, label=label)
+        # ring buffer with one row per label, written at column `head % row_max`
+        self.buf = np.zeros((len(self.labels), self.row_max), dtype=np.float64)
+        self.head = 0
+        # every line shares fixed x data, and the window slides by translating them all at once
+        self._x = np.arange(self.row_max, dtype=np.float64)
+        self._x_shift = Affine2D()
+        for i, label in enumerate(self.labels):
+            (line,) = self.ax.plot(
+                self._x, self.buf[i], animated=True, label=label,
+                transform=self._x_shift + self.ax.transData)
             self.lines[label] = line
+        # same order as the rows of `self.buf`
+        self._lines = list(self.lines.values())
         
-        # finalize size and location of plot and legend
-        self.ax.legend(
-            handles=self.lines.values(), frameon=False, 
-            bbox_to_anchor=(0.5, -0.2), loc='lower center', 
-            borderaxespad=0., ncol=len(self.lines))
-        plt.tight_layout()
+        # legend as plain annotations, which can be blitted along with the lines
+        self.legend = []
+        for i, line in enumerate(self._lines):
+            ann = self.ax.annotate(
+                line.get_label(), xy=(0.02, 0.95 - i*0.05), xycoords='axes fraction',
+                color=line.get_color(), va='top', animated=True)
+            self.legend.append(ann)
+        # fixed margins, so that no layout pass has to measure text
+        self.fig.subplots_adjust(left=0.08, right=0.98, top=0.95, bottom=0.08)
 
         # this enables fast rendering for matplotlib
-        self.bm = BlitManager(self.fig.canvas, self.lines.values())
+        # only the axes area is copied and blitted, since every animated artist is drawn inside it
+        self.bm = BlitManager(self.fig.canvas, self._lines + self.legend, bbox=self.ax.bbox)
         plt.show(block=False)
         plt.pause(.1)
     
     def _finish_when_closed(self, event):
         """ gracefully shut down the process when plot window is closed """
+        if self.timer is not None:
+            self.timer.stop()
         self.poller.close()
         plt.close('all')
 
@@ -214,7 +308,7 @@ class LinePlotter:
 
     def _is_row_valid(self, row:str):
         """ check whether given `row` only contains numbers and deliminators """
-        first_elem = row.split(self.delim)[0]
+        first_elem = row.partition(self.delim)[0]
         if len(first_elem) == 0:
             return False
         elif first_elem.replace('-','',1).replace('.','',1).isdigit():
@@ -222,62 +316,129 @@ class LinePlotter:
         else:
             return False
     
-    def push(self, frame:int):
-        """ append a string of row received from serial port
-        
-        Args:
-            frame (int) : number of frame to be rendered
-        """
+    def push(self):
+        """ append strings of rows received from serial port and blit them """
 
         if not self.poller.running:
             return
 
         # read from poller
-        rows = self.poller.rows
-        
-        for row in rows:
-            # render when unread row exists and graph is not paused
-            if len(row) == 0 or not self._is_row_valid(row):
-                continue
-            
-            # row string to row list
-            row = list(map(float, [i for i in row.split(self.delim) if len(i) > 0]))
+        rows = self.poller.take_rows()
+
+        # labels and buffer shape are fixed at init, so hoist lookups out of the per-row loop
+        buf, row_max, n_labels = self.buf, self.row_max, len(self.labels)
+        delim, apply_filter, is_row_valid = self.delim, self.poller.apply_filter, self._is_row_valid
+        head, row_idx = self.head, self.row_idx
+
+        # popleft also picks up a row appended by the reader thread right after the swap
+        valid = []
+        while rows:
+            row = apply_filter(rows.popleft())
+            # skip non-numeric rows, which also covers empty ones
+            if is_row_valid(row):
+                valid.append(_normalize_row(row, delim))
+        n_read = len(valid)
+
+        block = self._parse_batch(valid) if n_read > 0 else None
+        if block is not None:
+            # under a large backlog only the newest `row_max` rows can be shown, but older ones still count as samples.
+            # `head` stays put, since the kept rows then rewrite the whole ring in order.
+            skip = max(0, block.shape[0] - row_max)
+            block = block[skip:]
+            row_idx += skip
+            k, n = block.shape[0], min(block.shape[1], n_labels)
+
+            # overwrite the oldest columns in one go
+            prev = (head - 1) % row_max
+            cols = (head + np.arange(k)) % row_max
+            buf[:n, cols] = block[:, :n].T
+            # carry the previous value forward for labels missing from these rows
+            buf[n:, cols] = buf[n:, prev, None]
+            head += k
+            row_idx += k
 
-            # update x
-            self.d['x'].pop(0)
-            self.d['x'].append(self.row_idx)
+        else:
+            # row strings to float arrays, skipping rows with non-numeric fields
+            parsed = [row for row in (_parse_row(row, delim) for row in valid) if row is not None]
+            # same backlog trim as above
+            skip = max(0, len(parsed) - row_max)
+            row_idx += skip
+            for row in parsed[skip:]:
+                n = min(row.size, n_labels)
+
+                # overwrite the oldest column instead of shifting
+                col = head % row_max
+                buf[:n, col] = row[:n]
+                # carry the previous value forward for labels missing from this row
+                buf[n:, col] = buf[n:, col-1]
+                head += 1
+                row_idx += 1
+
+        self.head, self.row_idx = head, row_idx
+
+        # render all rows read in this frame with a single blit
+        if not self.paused and n_read > 0:
+            # gather all channels oldest column first in one copy
+            col = head % row_max
+            ordered = buf[:, np.r_[col:row_max, 0:col]]
+            for line, y in zip(self._lines, ordered):
+                line.set_ydata(y)
+
+            # newest row is at x = row_idx - 1, and rows before the first one are not shown
+            x_offset = row_idx - row_max
+            self._x_shift.clear().translate(x_offset, 0)
+
+            # limits do not depend on order, so scan the contiguous buffer rather than the gathered copy
+            if self._update_lims(max(x_offset, 0), row_idx - 1, buf):
+                # one full redraw on the next idle cycle, which also re-captures the blit background
+                self.fig.canvas.draw_idle()
+            else:
+                # called from the draw timer, so the event loop is already running
+                self.bm.update(flush=False)
 
-            # update labels
-            for i, label in enumerate(self.labels):
-                if i >= len(row):
-                    break
-                self.d[label].pop(0)
-                self.d[label].append(row[i])
-                # print(label, self.d[label][-5:])
-                
-                if not self.paused:
-                    self.lines[label].set_xdata(self.d['x'])
-                    self.lines[label].set_ydata(self.d[label])
-            
-            if not self.paused:
-                ymax = max([max(self.d[label]) for label in self.labels])
-                ymin = min([min(self.d[label]) for label in self.labels])
-                ymargin = 0.05 * (ymax - ymin)
-                if ymargin > 0:
-                    self.ax.set_ylim([ymin - ymargin, ymax + ymargin])
-                if self.d['x'][0] != self.d['x'][-1]:
-                    self.ax.set_xlim([self.d['x'][0], self.d['x'][-1]])
-                self.bm.update()
-
-            self.row_idx += 1
-        
-        # empty buffer
-        self.poller.rows = []
+    def _parse_batch(self, rows):
+        """ parse rows having the same number of fields with a single `np.fromstring` call
+
+        Args:
+            rows (list) : rows normalized by `_normalize_row`
+
+        Returns:
+            np.ndarray : parsed values shaped as `(len(rows), fields)`, or `None` if rows differ in length or fail to parse
+        """
+        n_fields = rows[0].count(self.delim) + 1
+        if any(row.count(self.delim) + 1 != n_fields for row in rows):
+            return None
+
+        # any unparseable row fails the whole batch, and the per-row path then skips just that row
+        vals = _parse_row(self.delim.join(rows), self.delim)
+        if vals is None:
+            return None
+        return vals.reshape(len(rows), n_fields)
+
+    def _update_lims(self, xmin, xmax, ydata):
+        """ update axis limits only when data leaves them or shrinks well inside them, returning whether any limit changed """
+        changed = False
+        ylim = _deadband_ylim(self._ylim, ydata)
+        if ylim is not None:
+            self._ylim = ylim
+            self.ax.set_ylim(ylim)
+            changed = True
+
+        # slide x window forward by a whole block once the newest row leaves it
+        if xmax > xmin and (self._xlim is None or xmax > self._xlim[1]):
+            self._xlim = (xmin, xmax + self.x_block)
+            self.ax.set_xlim(self._xlim)
+            changed = True
+
+        return changed
     
     def draw(self, interval:int):
         """ append a `row` over the plot after a given `interval` (ms) """
-        anim = animation.FuncAnimation(self.fig, self.push, frames=None, fargs=None, interval=interval)
-        return anim
+        # a plain canvas timer drives `push`, since `self.bm` does all drawing and FuncAnimation would redraw the figure
+        self.timer = self.fig.canvas.new_timer(interval=interval)
+        self.timer.add_callback(self.push)
+        self.timer.start()
+        return self.timer
 
 class BarPlotter:
     def __init__(self, labels, poller:Poller, delim:str=','):
@@ -298,6 +459,7 @@ class BarPlotter:
         self.fig.canvas.mpl_connect('button_press_event', self._click_to_pause)
         self.fig.canvas.mpl_connect('close_event', self._finish_when_closed)
         self.paused = False
+        self.timer = None
 
         # data trim
         self.delim = delim
@@ -305,15 +467,22 @@ class BarPlotter:
         # init data to visualize
         self.labels = labels
         self.bars = self.ax.bar(labels, [0]*len(labels))
-        plt.tight_layout()
+        self._rects = self.bars.patches
+        self.heights = np.zeros(len(labels), dtype=np.float64)
+        self._ylim = None
+        # fixed margins, so that no layout pass has to measure text
+        self.fig.subplots_adjust(left=0.08, right=0.98, top=0.95, bottom=0.08)
 
         # this enables fast rendering for matplotlib
-        self.bm = BlitManager(self.fig.canvas, self.bars)
+        # only the axes area is copied and blitted, since every animated artist is drawn inside it
+        self.bm = BlitManager(self.fig.canvas, self.bars, bbox=self.ax.bbox)
         plt.show(block=False)
         plt.pause(.1)
     
     def _finish_when_closed(self, event):
         """ gracefully shut down the process when plot window is closed """
+        if self.timer is not None:
+            self.timer.stop()
         self.poller.close()
         plt.close('all')
 
@@ -323,7 +492,7 @@ class BarPlotter:
 
     def _is_row_valid(self, row:str):
         """ check whether given `row` only contains numbers and deliminators """
-        first_elem = row.split(self.delim)[0]
+        first_elem = row.partition(self.delim)[0]
         if len(first_elem) == 0:
             return False
         elif first_elem.replace('-','',1).replace('.','',1).isdigit():
@@ -331,48 +500,62 @@ class BarPlotter:
         else:
             return False
 
-    def push(self, frame:int):
-        """ append a string of row received from serial port
-        
-        Args:
-            frame (int) : number of frame to be rendered
-        """
+    def push(self):
+        """ append strings of rows received from serial port and blit them """
 
         if not self.poller.running:
             return
 
         # read from poller
-        rows = self.poller.rows
+        rows = self.poller.take_rows()
         
-        for row in rows:
-            # render when unread row exists and graph is not paused
-            if len(row) == 0 or not self._is_row_valid(row):
+        if self.paused:
+            return
+
+        # walk back from the newest row, taking each bar's value from the newest row that reaches it
+        heights = self.heights.copy()
+        n_labels, filled = len(self.labels), 0
+        while rows and filled < n_labels:
+            row = self.poller.apply_filter(rows.pop())
+            if not self._is_row_valid(row):
                 continue
-            
-            # row string to row list
-            row = list(map(float, [i for i in row.split(self.delim) if len(i) > 0]))
+            # row string to float array, skipping rows with non-numeric fields
+            row = _parse_row(_normalize_row(row, self.delim), self.delim)
+            if row is None:
+                continue
+            n = min(row.size, n_labels)
+            if n > filled:
+                heights[filled:n] = row[filled:n]
+                filled = n
 
-            # update labels
-            for i, label in enumerate(self.labels):
-                if i >= len(row):
-                    break
-                if not self.paused:
-                    self.bars[i].set_height(row[i])
-            
-            if not self.paused:
-                ymax, ymin = max(row), min(row)
-                ymargin = 0.05 * (ymax - ymin)
-                if ymargin > 0:
-                    self.ax.set_ylim([ymin - ymargin, ymax + ymargin])
-                self.bm.update()
+        if filled == 0:
+            return
+
+        # update only the bars whose height changed, converting values to floats in one go
+        changed = np.flatnonzero(self.heights != heights)
+        self.heights = heights
+        rects = self._rects
+        for i, h in zip(changed.tolist(), heights[changed].tolist()):
+            rects[i].set_height(h)
         
-        # empty buffer
-        self.poller.rows = []
+        # y-limits only change past a deadband, since each change forces a full redraw
+        ylim = _deadband_ylim(self._ylim, heights)
+        if ylim is not None:
+            self._ylim = ylim
+            self.ax.set_ylim(ylim)
+            # one full redraw on the next idle cycle, which also re-captures the blit background
+            self.fig.canvas.draw_idle()
+        else:
+            # called from the draw timer, so the event loop is already running
+            self.bm.update(flush=False)
     
     def draw(self, interval:int):
         """ append a `row` over the plot after a given `interval` (ms) """
-        anim = animation.FuncAnimation(self.fig, self.push, frames=None, fargs=None, interval=interval)
-        return anim
+        # a plain canvas timer drives `push`, since `self.bm` does all drawing and FuncAnimation would redraw the figure
+        self.timer = self.fig.canvas.new_timer(interval=interval)
+        self.timer.add_callback(self.push)
+        self.timer.start()
+        return self.timer
 
 if __name__ == '__main__' :
     